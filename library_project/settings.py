@@ -6,7 +6,7 @@ from django.contrib.messages import constants as messages
 
 SECRET_KEY = 'django-insecure-your-secret-key-here'
 
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = []
 
@@ -28,10 +28,12 @@ CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'lms.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'lms.middleware.BranchMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,6 +65,27 @@ DATABASES = {
     }
 }
 
+# Branch catalogs and loans can be placed in their own database. Add an alias, e.g.
+#   DATABASES['downtown'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'branch_downtown.sqlite3'}
+# run `python manage.py migrate --database=downtown`, then set the branch's database to 'downtown'.
+DATABASE_ROUTERS = ['lms.routers.BranchRouter']
+LMS_BRANCH_SEARCH_WORKERS = 8
+# Seconds a worker keeps its in-memory list of branches; edits made through another
+# worker process (e.g. a new branch database) take effect after at most this long
+LMS_BRANCH_CACHE_TTL = 30
+
+# PBKDF2 cost for new and re-encoded passwords; lower it to trade hash strength for sign-up throughput
+LMS_PASSWORD_ITERATIONS = int(os.environ.get('LMS_PASSWORD_ITERATIONS', 1_000_000))
+PASSWORD_HASHERS = [
+    'lms.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# Membership ids reserved per database round trip by each server process
+LMS_MEMBERSHIP_ID_BLOCK_SIZE = 100
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -90,6 +113,24 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Production static mode: collectstatic writes content-hashed files with .gz/.br
+# siblings, and lms.middleware.StaticFilesMiddleware serves them with far-future
+# cache headers. During development runserver keeps serving the plain files.
+# Run collectstatic with DJANGO_DEBUG=False: with the default (True) the plain
+# storage is used and no manifest is written, and production pages then fail
+# with "Missing staticfiles manifest entry" errors.
+LMS_SERVE_STATIC = not DEBUG
+LMS_STATIC_MAX_AGE = 60 * 60 * 24 * 365
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'lms.storage.CompressedManifestStaticFilesStorage' if LMS_SERVE_STATIC
+                   else 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
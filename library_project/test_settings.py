@@ -0,0 +1,9 @@
+"""Settings for the test suite: `python manage.py test` uses them by default."""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+# A branch placed in a second database, to exercise routing and fan-out
+DATABASES['east'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'branch_east.sqlite3',
+}
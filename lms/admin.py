@@ -1,19 +1,93 @@
 from django.contrib import admin
-from .models import Book, Member, Transaction
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.db.models.functions import Lower
+from .branches import branch_dependents, get_branch
+from .changelists import LargeTableAdminMixin, normalize_isbn, prefix_q
+from .models import Book, Branch, Member, Transaction
+
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+    list_display = ['name', 'code', 'database']
+    search_fields = ['name', 'code']
+
+    def get_deleted_objects(self, objs, request):
+        # Books and loans in other branch databases are invisible to the collector
+        to_delete, model_count, perms_needed, protected = super().get_deleted_objects(objs, request)
+        for branch in objs:
+            protected += [f'{obj._meta.verbose_name.capitalize()}: {obj}' for obj in branch_dependents(branch)]
+        return to_delete, model_count, perms_needed, protected
+
+class BranchColumnMixin:
+    # Branches are cached in memory and may live in another database, so never join them
+    @admin.display(description='Branch', ordering='branch')
+    def branch_name(self, obj):
+        return get_branch(obj.branch_id) or '-'
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'genre', 'status', 'available_copies', 'total_copies']
-    list_filter = ['genre', 'status']
+class BookAdmin(LargeTableAdminMixin, BranchColumnMixin, admin.ModelAdmin):
+    list_display = ['title', 'author', 'genre', 'branch_name', 'status', 'available_copies', 'total_copies']
+    list_filter = ['branch', 'genre', 'status']
     search_fields = ['title', 'author', 'isbn']
+    search_help_text = 'Start of the title or author, or an exact ISBN.'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Only lookups the isbn and Lower(title)/Lower(author) indexes can serve
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        isbn = normalize_isbn(term)
+        if isbn:
+            return queryset.filter(isbn=isbn), False
+        return queryset.alias(title_lower=Lower('title'), author_lower=Lower('author')).filter(
+            prefix_q('title_lower', term) | prefix_q('author_lower', term)
+        ), False
 
 @admin.register(Member)
-class MemberAdmin(admin.ModelAdmin):
+class MemberAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'membership_id', 'phone', 'date_joined']
-    search_fields = ['user__username', 'user__first_name', 'user__last_name', 'membership_id']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    # auth_user names have no index, so members are found by their unique keys only
+    search_fields = ['membership_id', 'user__username']
+    search_help_text = 'Exact membership id or username.'
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        # A subquery rather than a join, so both sides of the OR use an index
+        users = User.objects.filter(username=term)
+        return queryset.filter(Q(membership_id__in={term, term.upper()}) | Q(user__in=users)), False
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
-    list_display = ['book', 'member', 'transaction_type', 'transaction_date', 'due_date', 'is_returned', 'fine_amount']
-    list_filter = ['transaction_type', 'is_returned']
-    search_fields = ['book__title', 'member__user__username']
\ No newline at end of file
+class TransactionAdmin(LargeTableAdminMixin, BranchColumnMixin, admin.ModelAdmin):
+    list_display = ['book', 'member', 'branch_name', 'transaction_type', 'transaction_date', 'due_date', 'is_returned', 'fine_amount']
+    list_filter = ['branch', 'transaction_type', 'is_returned']
+    # Members live in the default database, so only the book is joined
+    list_select_related = ['book']
+    raw_id_fields = ['book', 'member']
+    date_hierarchy = 'transaction_date'
+    search_fields = ['book__isbn', 'book__title', 'member__membership_id', 'member__user__username']
+    search_help_text = 'Exact ISBN, membership id or username, or the start of the book title.'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('member__user')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Resolve the term through indexed lookups on books and members first,
+        # then filter loans by key, instead of icontains scans across joins
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        books = Book.objects.using(queryset.db)
+        isbn = normalize_isbn(term)
+        if isbn:
+            return queryset.filter(book__in=books.filter(isbn=isbn)), False
+
+        member_ids = list(Member.objects.filter(
+            Q(membership_id__in={term, term.upper()}) | Q(user__username=term)
+        ).values_list('id', flat=True))
+        titles = books.alias(title_lower=Lower('title')).filter(prefix_q('title_lower', term))
+        return queryset.filter(Q(member_id__in=member_ids) | Q(book__in=titles)), False
@@ -0,0 +1,238 @@
+from array import array
+from datetime import datetime, time, timedelta
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .branches import branch_databases
+from .models import DailyCirculation, Member, RollupState, Transaction
+
+ROLLUP_NAME = 'daily_circulation'
+
+
+def _aggregate(transactions):
+    # One GROUP BY over a bounded slice of Transaction, keyed like DailyCirculation.
+    # Members live in the default database, so cohorts are resolved separately
+    # rather than joined (branch databases may not hold the member rows).
+    rows = list(
+        transactions
+        .annotate(day=TruncDate('transaction_date'), book_genre=F('book__genre'))
+        .values('day', 'book_genre', 'member_id')
+        .annotate(
+            borrows=Count('id', filter=Q(transaction_type='borrow')),
+            returns=Count('id', filter=Q(transaction_type='return')),
+        )
+        .order_by()
+    )
+    cohorts = dict(
+        Member.objects.using(DEFAULT_DB_ALIAS)
+        .filter(id__in={row['member_id'] for row in rows})
+        .values_list('id', 'date_joined')
+    )
+
+    counts = {}
+    for row in rows:
+        joined = cohorts.get(row['member_id'])
+        key = (row['day'], row['book_genre'], joined.year if joined else 0)
+        borrows, returns = counts.get(key, (0, 0))
+        counts[key] = (borrows + row['borrows'], returns + row['returns'])
+    return counts
+
+
+def _merge(counts):
+    # Add counts onto existing rollup rows, creating the missing ones
+    if not counts:
+        return
+    dates = {key[0] for key in counts}
+    existing = {
+        (r.date, r.genre, r.cohort): r
+        for r in DailyCirculation.objects.filter(date__in=dates)
+    }
+
+    to_update = []
+    to_create = []
+    for (day, genre, cohort), (borrows, returns) in counts.items():
+        rollup = existing.get((day, genre, cohort))
+        if rollup is None:
+            to_create.append(DailyCirculation(
+                date=day, genre=genre, cohort=cohort,
+                borrow_count=borrows, return_count=returns,
+            ))
+        else:
+            rollup.borrow_count += borrows
+            rollup.return_count += returns
+            to_update.append(rollup)
+
+    DailyCirculation.objects.bulk_update(to_update, ['borrow_count', 'return_count'])
+    DailyCirculation.objects.bulk_create(to_create)
+
+
+def _get_state(alias):
+    # One high-water mark per branch database, since transaction ids overlap between them
+    name = ROLLUP_NAME if alias == DEFAULT_DB_ALIAS else f'{ROLLUP_NAME}:{alias}'
+    state, _ = RollupState.objects.select_for_update().get_or_create(name=name)
+    return state
+
+
+def _local_midnight(day):
+    # Half-open datetime bounds keep the transaction_date index usable,
+    # unlike transaction_date__date, which wraps the column in a cast
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def update_rollups(batch_size=5000):
+    """Fold transactions created since the last run into the daily rollups.
+
+    Every branch database is processed in id-ordered batches, each committed
+    together with its high-water mark so an interrupted run resumes where it
+    stopped. Returns the number of transactions processed.
+    """
+    processed = 0
+    for alias in branch_databases():
+        transactions = Transaction.objects.using(alias)
+        while True:
+            with db_transaction.atomic():
+                state = _get_state(alias)
+                ids = list(
+                    transactions.filter(id__gt=state.last_transaction_id)
+                    .order_by('id')
+                    .values_list('id', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+
+                batch = transactions.filter(id__gt=state.last_transaction_id, id__lte=ids[-1])
+                _merge(_aggregate(batch))
+                state.last_transaction_id = ids[-1]
+                state.save()
+            processed += len(ids)
+    return processed
+
+
+def backfill_rollups(start=None, end=None, chunk_days=30):
+    """Rebuild the rollups for [start, end] from scratch, one date chunk at a time.
+
+    Only transactions already covered by the high-water marks are counted, so
+    a backfill never double counts rows that update_rollups() will pick up.
+    Each chunk holds the RollupState locks while it rebuilds, so it serializes
+    with a concurrent update_rollups() and always counts up to the current
+    marks. On a fresh install the marks are first moved to the newest
+    transactions and the whole history should be backfilled. Returns the
+    number of chunks.
+    """
+    aliases = branch_databases()
+    for alias in aliases:
+        with db_transaction.atomic():
+            state = _get_state(alias)
+            if not state.last_transaction_id:
+                state.last_transaction_id = Transaction.objects.using(alias).aggregate(m=Max('id'))['m'] or 0
+                state.save()
+
+    if start is None or end is None:
+        bounds = [
+            Transaction.objects.using(alias).aggregate(first=Min('transaction_date'), last=Max('transaction_date'))
+            for alias in aliases
+        ]
+        firsts = [b['first'] for b in bounds if b['first'] is not None]
+        lasts = [b['last'] for b in bounds if b['last'] is not None]
+        if not firsts:
+            return 0
+        start = start or timezone.localtime(min(firsts)).date()
+        end = end or timezone.localtime(max(lasts)).date()
+
+    chunks = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        with db_transaction.atomic():
+            counts = {}
+            for alias in aliases:
+                # Re-read under lock: update_rollups() may have moved the mark since the last chunk
+                state = _get_state(alias)
+                covered = Transaction.objects.using(alias).filter(id__lte=state.last_transaction_id)
+                chunk = _aggregate(covered.filter(
+                    transaction_date__gte=_local_midnight(chunk_start),
+                    transaction_date__lt=_local_midnight(chunk_end + timedelta(days=1)),
+                ))
+                for key, (borrows, returns) in chunk.items():
+                    b, r = counts.get(key, (0, 0))
+                    counts[key] = (b + borrows, r + returns)
+            DailyCirculation.objects.filter(date__range=(chunk_start, chunk_end)).delete()
+            _merge(counts)
+        chunks += 1
+        chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+# Array helpers: the series are small and flat, so plain typed arrays are
+# enough and we avoid pulling NumPy/pandas into the web process.
+
+def percentile(values, q):
+    # Linear interpolation between closest ranks (same as numpy's default)
+    data = array('d', sorted(values))
+    if not data:
+        return 0.0
+    pos = (len(data) - 1) * q / 100.0
+    lower = int(pos)
+    upper = min(lower + 1, len(data) - 1)
+    return data[lower] + (data[upper] - data[lower]) * (pos - lower)
+
+
+def linear_trend(values):
+    # Least-squares slope of the series against its index (units per day)
+    ys = array('d', values)
+    n = len(ys)
+    if n < 2:
+        return 0.0
+    mean_x = (n - 1) / 2.0
+    mean_y = sum(ys) / n
+    xs = array('d', (i - mean_x for i in range(n)))
+    denom = sum(x * x for x in xs)
+    return sum(x * (y - mean_y) for x, y in zip(xs, ys)) / denom
+
+
+def circulation_summary(days=30):
+    """Chart-ready series for the last `days` days, read from the rollups only."""
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    rollups = DailyCirculation.objects.filter(date__range=(start, end))
+
+    per_day = {
+        row['date']: (row['borrows'], row['returns'])
+        for row in rollups.values('date').annotate(
+            borrows=Sum('borrow_count'), returns=Sum('return_count')
+        ).order_by()
+    }
+    labels = []
+    borrows = array('l')
+    returns = array('l')
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        b, r = per_day.get(day, (0, 0))
+        labels.append(day.isoformat())
+        borrows.append(b)
+        returns.append(r)
+
+    genre_names = dict(DailyCirculation._meta.get_field('genre').choices)
+    by_genre = [
+        {'label': genre_names.get(row['genre'], row['genre']), 'borrows': row['borrows']}
+        for row in rollups.values('genre').annotate(borrows=Sum('borrow_count')).order_by('-borrows')
+    ]
+    by_cohort = [
+        {'label': str(row['cohort']), 'borrows': row['borrows']}
+        for row in rollups.values('cohort').annotate(borrows=Sum('borrow_count')).order_by('cohort')
+    ]
+
+    return {
+        'labels': labels,
+        'borrows': borrows.tolist(),
+        'returns': returns.tolist(),
+        'by_genre': by_genre,
+        'by_cohort': by_cohort,
+        'median_borrows': round(percentile(borrows, 50), 1),
+        'p90_borrows': round(percentile(borrows, 90), 1),
+        'borrow_trend': round(linear_trend(borrows), 2),
+    }
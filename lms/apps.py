@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LmsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lms'
+
+    def ready(self):
+        # Connect the branch cache, change feed and availability push handlers
+        from . import branches, changes, events  # noqa: F401
@@ -0,0 +1,206 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from django.db import transaction as db_transaction
+from django.db.models import F, ProtectedError, Q
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Book, Branch, Member, Transaction
+
+_current_branch = ContextVar('lms_current_branch', default=None)
+
+# Branch rows are tiny and read on every routed query, so keep them in memory.
+# Saves in this process clear the cache at once; other worker processes only
+# notice a new or moved branch when their copy expires (LMS_BRANCH_CACHE_TTL).
+_branch_cache = None
+_branch_cache_expires = 0.0
+
+
+def _branches():
+    global _branch_cache, _branch_cache_expires
+    now = time.monotonic()
+    if _branch_cache is None or now >= _branch_cache_expires:
+        _branch_cache = {b.id: b for b in Branch.objects.using(DEFAULT_DB_ALIAS)}
+        _branch_cache_expires = now + getattr(settings, 'LMS_BRANCH_CACHE_TTL', 30)
+    return _branch_cache
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def clear_branch_cache(**kwargs):
+    global _branch_cache
+    _branch_cache = None
+
+
+# Books and loans may live in another database than the Branch and Member
+# rows they reference, where the deletion collector never looks (it only
+# follows relations inside the deleting object's database). These handlers
+# apply the PROTECT and CASCADE rules to every branch database.
+
+def branch_dependents(branch, using=DEFAULT_DB_ALIAS, limit=5):
+    """Up to `limit` books and loans per database other than `using` that still belong to `branch`."""
+    dependents = []
+    for alias in branch_databases():
+        if alias == using:
+            # Covered by the collector's own PROTECT check
+            continue
+        for model in (Book, Transaction):
+            dependents += model.objects.using(alias).filter(branch_id=branch.pk)[:limit]
+    return dependents
+
+
+@receiver(pre_delete, sender=Branch)
+def protect_branch_rows(sender, instance, using, **kwargs):
+    dependents = branch_dependents(instance, using)
+    if dependents:
+        raise ProtectedError(
+            f'Cannot delete branch "{instance}": it still has books or loans.',
+            set(dependents),
+        )
+
+
+@receiver(pre_delete, sender=Member)
+def delete_member_loans(sender, instance, using, **kwargs):
+    for alias in branch_databases():
+        if alias != using:
+            Transaction.objects.using(alias).filter(member_id=instance.pk).delete()
+
+
+def get_branch(branch_id):
+    if branch_id is None:
+        return None
+    return _branches().get(branch_id)
+
+
+def get_branch_by_code(code):
+    for branch in _branches().values():
+        if branch.code == code:
+            return branch
+    return None
+
+
+def all_branches():
+    return sorted(_branches().values(), key=lambda b: b.name)
+
+
+def branch_databases():
+    # The default database always holds unassigned books and legacy loans
+    return sorted({DEFAULT_DB_ALIAS} | {b.database for b in _branches().values()})
+
+
+def current_branch():
+    return _current_branch.get()
+
+
+@contextmanager
+def use_branch(branch):
+    token = _current_branch.set(branch)
+    try:
+        yield branch
+    finally:
+        _current_branch.reset(token)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _fan_out_executor():
+    # One pool per process, so requests don't pay thread startup
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'LMS_BRANCH_SEARCH_WORKERS', 8),
+                thread_name_prefix='lms-fan-out',
+            )
+    return _executor
+
+
+def _run_in_worker(fn, alias):
+    # Pool threads keep their connections between calls; like request_started
+    # does for request threads, drop the ones past CONN_MAX_AGE or broken.
+    close_old_connections()
+    return fn(alias)
+
+
+def fan_out(fn):
+    """Call fn(alias) for every branch database and return the results in alias order.
+
+    With more than one database the calls run on a shared thread pool.
+    """
+    aliases = branch_databases()
+    if len(aliases) == 1:
+        return [fn(aliases[0])]
+    executor = _fan_out_executor()
+    return list(executor.map(_run_in_worker, [fn] * len(aliases), aliases))
+
+
+def search_books(query=None, genre=None):
+    # Cross-branch catalog search: same filter on every branch database, merged by title
+    def search(alias):
+        books = Book.objects.using(alias).all()
+        if query:
+            books = books.filter(
+                Q(title__icontains=query) |
+                Q(author__icontains=query) |
+                Q(isbn__icontains=query)
+            )
+        if genre:
+            books = books.filter(genre=genre)
+        return list(books)
+
+    results = [book for books in fan_out(search) for book in books]
+    return sorted(results, key=lambda b: (b.title.lower(), b.branch_code))
+
+
+def transfer_copies(book, to_branch, copies=1):
+    """Move available copies of `book` to `to_branch`, which may live in another database.
+
+    The target branch gets a catalog entry with the same ISBN if it has none.
+    Raises ValueError if not enough copies are on the shelf.
+    Returns the target Book.
+    """
+    if copies < 1:
+        raise ValueError('At least one copy must be transferred.')
+    if book.branch_id == to_branch.id:
+        raise ValueError('The book already belongs to this branch.')
+
+    source_db = book._state.db or DEFAULT_DB_ALIAS
+    target_db = to_branch.database
+
+    with db_transaction.atomic(using=source_db), db_transaction.atomic(using=target_db):
+        moved = Book.objects.using(source_db).filter(pk=book.pk, available_copies__gte=copies).update(
+            available_copies=F('available_copies') - copies,
+            total_copies=F('total_copies') - copies,
+        )
+        if not moved:
+            raise ValueError(f'Not enough available copies of "{book.title}" to transfer.')
+        book.refresh_from_db(fields=['available_copies', 'total_copies'])
+        book.save(update_fields=['status'])
+
+        target, created = Book.objects.using(target_db).select_for_update().get_or_create(
+            branch=to_branch, isbn=book.isbn,
+            defaults={
+                'title': book.title,
+                'author': book.author,
+                'genre': book.genre,
+                'published_date': book.published_date,
+                'publisher': book.publisher,
+                'description': book.description,
+                'cover_image': book.cover_image,
+                'total_copies': copies,
+                'available_copies': copies,
+            },
+        )
+        if not created:
+            target.total_copies += copies
+            target.available_copies += copies
+            target.save()
+    return target
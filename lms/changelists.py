@@ -0,0 +1,134 @@
+import re
+
+from django.conf import settings
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .middleware import AT_BRANCH_VAR, BRANCH_VAR
+
+CURSOR_VAR = 'cursor'
+ISBN_RE = re.compile(r'^(\d{9}[\dX]|\d{13})$')
+
+
+def normalize_isbn(term):
+    """The search term as a stored ISBN (no hyphens or spaces, upper-case X), or None."""
+    isbn = term.replace('-', '').replace(' ', '').upper()
+    return isbn if ISBN_RE.match(isbn) else None
+
+
+def prefix_q(name, term):
+    """Q for values of `name`, an alias of Lower(field), that start with `term`.
+
+    Written as a range instead of istartswith: LIKE on SQLite and
+    UPPER(...) LIKE on PostgreSQL cannot use a B-tree index, while a range
+    on LOWER(field) is served by a functional Lower(field) index.
+    """
+    term = term.lower()
+    return Q(**{f'{name}__gte': term, f'{name}__lt': term[:-1] + chr(ord(term[-1]) + 1)})
+
+
+def estimate_table_rows(queryset):
+    """Row count of the queryset's table from planner statistics, or None."""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    queries = {
+        'postgresql': ('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table]),
+        'mysql': ('SELECT table_rows FROM information_schema.tables '
+                  'WHERE table_schema = DATABASE() AND table_name = %s', [table]),
+        # Filled in by ANALYZE; the first number of each row is the table size
+        'sqlite': ('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    sql, params = queries[connection.vendor]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never runs an unbounded COUNT(*).
+
+    Unfiltered lists use the database's table statistics; filtered lists
+    (or databases without statistics) count at most LMS_ADMIN_COUNT_LIMIT rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_table_rows(queryset)
+            if estimate is not None:
+                return estimate
+        limit = getattr(settings, 'LMS_ADMIN_COUNT_LIMIT', 10000)
+        return queryset.order_by()[:limit].count()
+
+
+class CursorChangeList(ChangeList):
+    """ChangeList with keyset pagination on the primary key.
+
+    With the default (newest first) ordering, `?cursor=<pk>` shows the rows
+    after that key, so paging deep into a large table stays an index range
+    scan instead of a growing OFFSET. Page number links keep working.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = None
+        if ORDER_VAR not in request.GET:
+            try:
+                self.cursor = int(request.GET[CURSOR_VAR])
+            except (KeyError, ValueError):
+                pass
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        # Consumed by BranchMiddleware, not field lookups
+        params.pop(BRANCH_VAR, None)
+        params.pop(AT_BRANCH_VAR, None)
+        return params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filter, sort and page links start again from the top
+        return super().get_query_string(new_params, [CURSOR_VAR] + list(remove or []))
+
+    def get_queryset(self, request, exclude_parameters=None):
+        qs = super().get_queryset(request, exclude_parameters)
+        if self.cursor is not None:
+            qs = qs.filter(pk__lt=self.cursor)
+        return qs
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_cursor = None
+        if ORDER_VAR not in self.params and not self.show_all:
+            rows = list(self.result_list)
+            if len(rows) == self.list_per_page:
+                self.next_cursor = rows[-1].pk
+
+    @property
+    def next_cursor_url(self):
+        if self.next_cursor is None:
+            return None
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class LargeTableAdminMixin:
+    # Admin performance mode for tables with millions of rows
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ['-pk']
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
@@ -0,0 +1,94 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Book, ChangeLog, Transaction
+
+
+def book_data(book):
+    return {
+        'id': book.id,
+        'isbn': book.isbn,
+        'title': book.title,
+        'branch': book.branch_code,
+        'available_copies': book.available_copies,
+        'total_copies': book.total_copies,
+        'status': book.status,
+    }
+
+
+def transaction_data(transaction):
+    return {
+        'id': transaction.id,
+        'book': transaction.book_id,
+        'member': transaction.member_id,
+        'branch': transaction.branch_code,
+        'transaction_type': transaction.transaction_type,
+        'transaction_date': transaction.transaction_date.isoformat() if transaction.transaction_date else None,
+        'due_date': transaction.due_date.isoformat() if transaction.due_date else None,
+        'return_date': transaction.return_date.isoformat() if transaction.return_date else None,
+        'is_returned': transaction.is_returned,
+        'fine_amount': str(transaction.fine_amount),
+        'sync_id': transaction.sync_id,
+    }
+
+
+SERIALIZERS = {
+    Book: ('book', book_data),
+    Transaction: ('transaction', transaction_data),
+}
+
+
+def change_entry(instance, action='save'):
+    model, serialize = SERIALIZERS[type(instance)]
+    return ChangeLog(
+        model=model,
+        object_id=instance.pk,
+        branch_id=instance.branch_id,
+        action=action,
+        data=serialize(instance) if action == 'save' else {'id': instance.pk},
+    )
+
+
+def record_changes(instances, action='save'):
+    # For bulk_create/bulk_update paths, which do not send model signals
+    ChangeLog.objects.bulk_create([change_entry(instance, action) for instance in instances])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Transaction)
+def record_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        change_entry(instance).save()
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Transaction)
+def record_delete(sender, instance, **kwargs):
+    change_entry(instance, 'delete').save()
+
+
+def changes_since(cursor, limit=500, model=None, branch=None):
+    """Return (changes, next_cursor, has_more) for entries after `cursor`."""
+    entries = ChangeLog.objects.filter(id__gt=cursor)
+    if model:
+        entries = entries.filter(model=model)
+    if branch is not None:
+        entries = entries.filter(branch=branch)
+
+    batch = list(entries.order_by('id')[:limit + 1])
+    has_more = len(batch) > limit
+    batch = batch[:limit]
+
+    changes = [
+        {
+            'cursor': entry.id,
+            'model': entry.model,
+            'action': entry.action,
+            'object_id': entry.object_id,
+            'data': entry.data,
+            'created_at': entry.created_at.isoformat(),
+        }
+        for entry in batch
+    ]
+    next_cursor = batch[-1].id if batch else cursor
+    return changes, next_cursor, has_more
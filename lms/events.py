@@ -0,0 +1,133 @@
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Book
+
+
+class Subscription:
+    """One watcher's inbox, owned by the event loop serving its connection.
+
+    Updates are coalesced per book: a slow client only ever receives the
+    latest availability, so its inbox never grows beyond the books it watches.
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.loop = asyncio.get_running_loop()
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def deliver(self, key, payload):
+        # Always runs on self.loop
+        self.pending[key] = payload
+        self.ready.set()
+
+    async def get(self):
+        await self.ready.wait()
+        self.ready.clear()
+        pending, self.pending = self.pending, {}
+        return list(pending.values())
+
+
+class AvailabilityBroker:
+    """In-process pub/sub for book availability.
+
+    Publishers run in request threads (or the event loop); each subscriber's
+    inbox is updated on its own loop via call_soon_threadsafe. Only events
+    published in the same process are seen, so run the SSE endpoint in the
+    same ASGI process that handles circulation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    @contextmanager
+    def subscribe(self, keys):
+        subscription = Subscription(keys)
+        with self._lock:
+            for key in keys:
+                self._subscribers.setdefault(key, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                for key in keys:
+                    watchers = self._subscribers.get(key)
+                    if watchers is not None:
+                        watchers.discard(subscription)
+                        if not watchers:
+                            del self._subscribers[key]
+
+    def publish(self, key, payload):
+        with self._lock:
+            watchers = list(self._subscribers.get(key, ()))
+        for subscription in watchers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, key, payload)
+            except RuntimeError:
+                # The connection's loop has shut down; its subscription is going away
+                pass
+
+    def watcher_count(self):
+        with self._lock:
+            return sum(len(watchers) for watchers in self._subscribers.values())
+
+
+broker = AvailabilityBroker()
+
+
+def availability_key(book):
+    # Book ids are only unique within one branch database
+    return (book._state.db, book.pk)
+
+
+def availability_data(book):
+    return {
+        'book': book.pk,
+        'available_copies': book.available_copies,
+        'total_copies': book.total_copies,
+        'status': book.status,
+    }
+
+
+def publish_availability(books):
+    """Announce the books' current availability once the surrounding transaction commits."""
+    for book in books:
+        key, payload = availability_key(book), availability_data(book)
+        db_transaction.on_commit(lambda key=key, payload=payload: broker.publish(key, payload), using=key[0])
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        publish_availability([instance])
+
+
+def format_event(payload, event='availability'):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def availability_events(alias, book_ids, heartbeat=15):
+    """Server-sent event stream of availability for `book_ids` in database `alias`."""
+    with broker.subscribe([(alias, pk) for pk in book_ids]) as subscription:
+        yield 'retry: 5000\n\n'
+        # Subscribed before reading the snapshot, so no change can fall in between
+        async for book in Book.objects.using(alias).filter(pk__in=book_ids):
+            yield format_event(availability_data(book))
+
+        while True:
+            try:
+                updates = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+            for payload in updates:
+                yield format_event(payload)
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 with the work factor taken from LMS_PASSWORD_ITERATIONS.
+
+    It keeps the pbkdf2_sha256 algorithm name, so existing hashes still
+    verify and are re-encoded at the configured cost on the next login.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'LMS_PASSWORD_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
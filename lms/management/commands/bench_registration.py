@@ -0,0 +1,81 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from lms.forms import UserRegisterForm
+from lms.registration import MembershipIdAllocator, import_members, register_member
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure sign-ups per second for the registration pipeline and the bulk importer. '
+        'Every sign-up is committed to the configured database like a real one; the '
+        'benchmark users are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help='Sign-ups per scenario.')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Concurrent sign-ups in the register scenario, to simulate a burst.')
+        parser.add_argument('--workers', type=int, default=None, help='Hashing processes for the bulk importer.')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        threads = max(1, options['threads'])
+        # A separate sequence and prefix so the benchmark never touches real ids,
+        # and a per-run username prefix so leftovers of an aborted run can't collide
+        allocator = MembershipIdAllocator(name='benchmark', prefix='B')
+        prefix = f'bench-{uuid.uuid4().hex[:8]}-'
+
+        def sign_up(i):
+            form = UserRegisterForm({
+                'username': f'{prefix}signup-{i}',
+                'first_name': 'Bench',
+                'last_name': str(i),
+                'email': f'bench{i}@example.com',
+                'password1': 'Quill-Harbor-7341',
+                'password2': 'Quill-Harbor-7341',
+            })
+            if not form.is_valid():
+                raise ValueError(form.errors.as_text())
+            register_member(form, allocator=allocator)
+
+        def sign_ups(numbers):
+            try:
+                for i in numbers:
+                    sign_up(i)
+            finally:
+                # Each thread has its own connection
+                connection.close()
+
+        def register():
+            if threads == 1:
+                for i in range(count):
+                    sign_up(i)
+                return
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                # Consume the results so errors in a thread are raised here
+                list(pool.map(sign_ups, [range(t, count, threads) for t in range(threads)]))
+
+        def bulk_import():
+            rows = [
+                {'username': f'{prefix}import-{i}', 'first_name': 'Bench', 'last_name': str(i),
+                 'password': 'Quill-Harbor-7341'}
+                for i in range(count)
+            ]
+            import_members(rows, workers=options['workers'], allocator=allocator)
+
+        label = 'register view pipeline' + (f' ({threads} threads)' if threads > 1 else '')
+        try:
+            for label, scenario in [(label, register), ('bulk import', bulk_import)]:
+                started = time.perf_counter()
+                scenario()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{label}: {count} sign-ups in {elapsed:.2f}s ({count / elapsed:.1f}/s)')
+        finally:
+            # Members go with their users
+            User.objects.filter(username__startswith=prefix).delete()
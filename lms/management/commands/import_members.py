@@ -0,0 +1,42 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.registration import hashing_pool, import_members
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create members from a CSV roster (username, first_name, last_name, email, password, ...).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help='CSV file with a header row; only username is required.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of members created per database transaction.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes used to hash passwords (default: one per CPU).')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['roster'], newline='') as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            raise CommandError(f'Could not read roster: {e}')
+        if rows and 'username' not in rows[0]:
+            raise CommandError('The roster needs a username column.')
+
+        rows = [row for row in rows if row.get('username')]
+        created = 0
+        skipped = []
+        batch_size = max(1, options['batch_size'])
+        # One pool for the whole roster; its startup is paid once, not per batch
+        with hashing_pool(options['workers']) as pool:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                batch_created, batch_skipped = import_members(batch, workers=options['workers'], pool=pool)
+                created += batch_created
+                skipped += batch_skipped
+                self.stdout.write(f'{start + len(batch)}/{len(rows)} rows processed')
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {len(skipped)} existing username(s): {', '.join(skipped[:10])}"))
+        self.stdout.write(self.style.SUCCESS(f'Created {created} member(s).'))
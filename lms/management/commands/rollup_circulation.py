@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.analytics import backfill_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Update the daily circulation rollups used by the admin dashboard.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help='Rebuild the rollups for a date range instead of applying new transactions.')
+        parser.add_argument('--start', help='First day to backfill (YYYY-MM-DD). Defaults to the oldest transaction.')
+        parser.add_argument('--end', help='Last day to backfill (YYYY-MM-DD). Defaults to the newest transaction.')
+        parser.add_argument('--chunk-days', type=int, default=30,
+                            help='Number of days rebuilt per database transaction when backfilling.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of transactions folded in per database transaction.')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            start = self._parse_date(options['start'])
+            end = self._parse_date(options['end'])
+            chunks = backfill_rollups(start, end, chunk_days=options['chunk_days'])
+            self.stdout.write(self.style.SUCCESS(f'Backfilled {chunks} chunk(s).'))
+        else:
+            processed = update_rollups(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Folded {processed} transaction(s) into the rollups.'))
+
+    def _parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'Invalid date: {value}')
@@ -0,0 +1,38 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.sync import apply_offline_events
+
+
+class Command(BaseCommand):
+    help = 'Apply borrows and returns recorded offline by a circulation desk or kiosk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='JSON file with a list of offline events, or - for stdin.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be applied and roll everything back.')
+
+    def handle(self, *args, **options):
+        try:
+            if options['file'] == '-':
+                events = json.load(sys.stdin)
+            else:
+                with open(options['file']) as f:
+                    events = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read events: {e}')
+        if not isinstance(events, list):
+            raise CommandError('Expected a JSON list of events.')
+
+        result = apply_offline_events(events, dry_run=options['dry_run'])
+
+        for c in result['conflicts']:
+            self.stdout.write(self.style.WARNING(f"Conflict {c['sync_id']}: {c['reason']}"))
+        if result['duplicates']:
+            self.stdout.write(f"Skipped {len(result['duplicates'])} already applied event(s).")
+        prefix = 'Would apply' if options['dry_run'] else 'Applied'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {result['applied']} event(s), {len(result['conflicts'])} conflict(s)."
+        ))
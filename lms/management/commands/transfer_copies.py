@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.branches import get_branch_by_code, transfer_copies
+from lms.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Move available copies of a book from one branch to another.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('isbn')
+        parser.add_argument('from_branch', help='Code of the branch giving the copies.')
+        parser.add_argument('to_branch', help='Code of the branch receiving the copies.')
+        parser.add_argument('--copies', type=int, default=1)
+
+    def handle(self, *args, **options):
+        source = self._branch(options['from_branch'])
+        target = self._branch(options['to_branch'])
+        try:
+            book = Book.objects.using(source.database).get(branch=source, isbn=options['isbn'])
+        except Book.DoesNotExist:
+            raise CommandError(f"{source} has no book with ISBN {options['isbn']}.")
+
+        try:
+            target_book = transfer_copies(book, target, copies=options['copies'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Transferred {options['copies']} copy(ies) of \"{book.title}\" to {target} "
+            f"({target_book.available_copies}/{target_book.total_copies} available there)."
+        ))
+
+    def _branch(self, code):
+        branch = get_branch_by_code(code)
+        if branch is None:
+            raise CommandError(f'Unknown branch: {code}')
+        return branch
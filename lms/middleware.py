@@ -0,0 +1,153 @@
+import mimetypes
+import os
+import re
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags
+
+from .branches import get_branch_by_code, use_branch
+
+BRANCH_VAR = 'branch'
+AT_BRANCH_VAR = 'at'
+
+
+class BranchMiddleware:
+    """Select the branch whose database serves this request.
+
+    `?branch=<code>` (the branch selector) switches branch and remembers it
+    in the session, `?branch=all` goes back to searching every branch.
+    `?at=<code>` serves just this request from a branch, for links to a
+    book or loan that lives there, and leaves the remembered choice alone.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        code = request.GET.get(BRANCH_VAR)
+        if code == 'all':
+            request.session.pop('branch', None)
+        elif code and get_branch_by_code(code) is not None:
+            request.session['branch'] = code
+
+        request.branch = (
+            get_branch_by_code(request.GET.get(AT_BRANCH_VAR, ''))
+            or get_branch_by_code(request.session.get('branch', ''))
+        )
+        with use_branch(request.branch):
+            return self.get_response(request)
+
+
+class StaticFile:
+    def __init__(self, path, variants):
+        stat = os.stat(path)
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        tag = f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+        # Each encoding is a different representation, so each gets its own ETag
+        self.etags = {None: f'"{tag}"'}
+        self.etags.update((encoding, f'"{tag}-{encoding}"') for encoding, _ in variants)
+        self.last_modified = http_date(stat.st_mtime)
+        # (encoding, path) pairs, best first
+        self.variants = variants
+
+
+def parse_accept_encoding(header):
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    codings = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.lower()] = q
+    return codings
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files straight from STATIC_ROOT.
+
+    The file index is built once at startup. Responses use the pre-compressed
+    siblings written by lms.storage when the client accepts them, are sent
+    with FileResponse (so the WSGI server can use sendfile), and hashed
+    names get far-future cache headers. Enabled with LMS_SERVE_STATIC.
+    """
+
+    HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+    ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'LMS_SERVE_STATIC', False) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = urlparse(settings.STATIC_URL).path
+        self.max_age = getattr(settings, 'LMS_STATIC_MAX_AGE', 60 * 60 * 24 * 365)
+        self.files = self.build_index(str(settings.STATIC_ROOT))
+
+    def build_index(self, root):
+        files = {}
+        compressed_suffixes = tuple(suffix for _, suffix in self.ENCODINGS)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(compressed_suffixes):
+                    continue
+                path = os.path.join(dirpath, filename)
+                variants = [
+                    (encoding, path + suffix)
+                    for encoding, suffix in self.ENCODINGS
+                    if os.path.exists(path + suffix)
+                ]
+                url = self.prefix + os.path.relpath(path, root).replace(os.sep, '/')
+                files[url] = StaticFile(path, variants)
+        return files
+
+    def __call__(self, request):
+        static_file = self.files.get(request.path_info)
+        if static_file is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    def choose_variant(self, request, static_file):
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+        best = (0.0, None, static_file.path)
+        for encoding, path in static_file.variants:
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            # Variants are listed best first, so only a higher q-value wins
+            if q > best[0]:
+                best = (q, encoding, path)
+        return best[1:]
+
+    def serve(self, request, static_file):
+        encoding, path = self.choose_variant(request, static_file)
+        etag = static_file.etags[encoding]
+
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        if_none_match = [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            # Static assets are displayed inline, not downloaded
+            del response['Content-Disposition']
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+        response['ETag'] = etag
+        response['Last-Modified'] = static_file.last_modified
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        if self.HASHED_NAME.search(static_file.path):
+            response['Cache-Control'] = f'max-age={self.max_age}, public, immutable'
+        else:
+            response['Cache-Control'] = 'max-age=60, public'
+        return response
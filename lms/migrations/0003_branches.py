@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_main_branch(apps, schema_editor):
+    # Existing catalogs become the "main" branch; branch databases start empty
+    db_alias = schema_editor.connection.alias
+    if db_alias != 'default':
+        return
+    Book = apps.get_model('lms', 'Book')
+    Branch = apps.get_model('lms', 'Branch')
+    Transaction = apps.get_model('lms', 'Transaction')
+    if not Book.objects.using(db_alias).exists():
+        return
+    main, _ = Branch.objects.using(db_alias).get_or_create(code='main', defaults={'name': 'Main Library'})
+    Book.objects.using(db_alias).filter(branch__isnull=True).update(branch=main)
+    Transaction.objects.using(db_alias).filter(branch__isnull=True).update(branch=main)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0002_circulation_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('address', models.TextField(blank=True)),
+                ('database', models.CharField(default='default', max_length=50)),
+            ],
+            options={
+                'verbose_name_plural': 'branches',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn',
+            field=models.CharField(max_length=13),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='member',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='lms.member'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='branch',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='books', to='lms.branch'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='branch',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='lms.branch'),
+        ),
+        migrations.RunPython(assign_main_branch, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(fields=('isbn', 'branch'), name='unique_branch_isbn'),
+        ),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('isbn',), name='unique_unassigned_isbn'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:54
+
+from django.db import migrations, models
+
+
+def create_member_sequence(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    if db_alias != 'default':
+        return
+    Member = apps.get_model('lms', 'Member')
+    MembershipSequence = apps.get_model('lms', 'MembershipSequence')
+    last = Member.objects.using(db_alias).aggregate(m=models.Max('id'))['m'] or 0
+    MembershipSequence.objects.using(db_alias).get_or_create(name='member', defaults={'next_value': last + 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0005_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_member_sequence, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,33 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 
+class Branch(models.Model):
+    code = models.SlugField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+    address = models.TextField(blank=True)
+    # Database alias (see settings.DATABASES) holding this branch's books and transactions
+    database = models.CharField(max_length=50, default='default')
+
+    class Meta:
+        verbose_name_plural = 'branches'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class BranchQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        # Let the router place the new row by its branch, as Model.save() does,
+        # instead of by the branch selected for the request
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
 class Book(models.Model):
     STATUS_CHOICES = [
         ('available', 'Available'),
@@ -23,7 +48,7 @@ class Book(models.Model):
     
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=100)
-    isbn = models.CharField(max_length=13, unique=True)
+    isbn = models.CharField(max_length=13)
     genre = models.CharField(max_length=20, choices=GENRE_CHOICES, default='other')
     published_date = models.DateField(null=True, blank=True)
     publisher = models.CharField(max_length=100, blank=True)
@@ -32,13 +57,37 @@ class Book(models.Model):
     available_copies = models.PositiveIntegerField(default=1)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='available')
     cover_image = models.ImageField(upload_to='book_covers/', null=True, blank=True)
+    # Branches may live in another database, so no FK constraint is enforced
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True,
+                               related_name='books', db_constraint=False)
+    
+    objects = BranchQuerySet.as_manager()
     
     # created_at = models.DateTimeField(auto_now_add=True)
     # updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # isbn first, so lookups by ISBN alone can use it as their index
+            models.UniqueConstraint(fields=['isbn', 'branch'], name='unique_branch_isbn'),
+            models.UniqueConstraint(fields=['isbn'], condition=models.Q(branch__isnull=True),
+                                    name='unique_unassigned_isbn'),
+        ]
+        indexes = [
+            # Case-insensitive prefix search on title/author (see lms.changelists.prefix_lookup)
+            models.Index(Lower('title'), name='book_title_lower'),
+            models.Index(Lower('author'), name='book_author_lower'),
+        ]
+
     def __str__(self):
         return f"{self.title} by {self.author}"
     
+    @property
+    def branch_code(self):
+        from .branches import get_branch
+        branch = get_branch(self.branch_id)
+        return branch.code if branch else ''
+    
     def save(self, *args, **kwargs):
         if self.available_copies > 0:
             self.status = 'available'
@@ -56,6 +105,14 @@ class Member(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.membership_id})"
 
+class MembershipSequence(models.Model):
+    # Next number to hand out; application servers reserve blocks of numbers at a time
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
         ('borrow', 'Borrow'),
@@ -63,18 +120,42 @@ class Transaction(models.Model):
     ]
     
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
-    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    # Members always live in the default database, branch loans may not;
+    # lms.branches cascades member deletes to the other databases
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, db_constraint=False)
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True,
+                               related_name='transactions', db_constraint=False)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
-    transaction_date = models.DateTimeField(auto_now_add=True)
+    transaction_date = models.DateTimeField(auto_now_add=True, db_index=True)
     due_date = models.DateField()
     return_date = models.DateField(null=True, blank=True)
     fine_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
     is_returned = models.BooleanField(default=False)
+    # Client-generated id of a loan recorded offline, so re-syncing is idempotent
+    sync_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    
+    objects = BranchQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Open/overdue loan lookups on the dashboard and admin filters
+            models.Index(fields=['transaction_type', 'is_returned', 'due_date'], name='transaction_open_loans'),
+        ]
     
     def __str__(self):
         return f"{self.member.user.username} - {self.book.title} ({self.transaction_type})"
     
+    @property
+    def branch_code(self):
+        from .branches import get_branch
+        branch = get_branch(self.branch_id)
+        return branch.code if branch else ''
+    
     def save(self, *args, **kwargs):
+        # Loans belong to the branch that owns the copy
+        if self.branch_id is None:
+            self.branch_id = self.book.branch_id
+        
         # Set due date to 14 days from transaction date for borrow transactions
         if self.transaction_type == 'borrow' and not self.due_date:
             self.due_date = timezone.now().date() + timedelta(days=14)
@@ -104,4 +185,56 @@ class Transaction(models.Model):
     def is_overdue(self):
         if not self.is_returned and timezone.now().date() > self.due_date:
             return True
-        return False
\ No newline at end of file
+        return False
+
+class DailyCirculation(models.Model):
+    # Pre-aggregated borrow/return volumes, one row per day, genre and member cohort.
+    # Maintained by lms.analytics so the dashboard never has to GROUP BY Transaction.
+    date = models.DateField()
+    genre = models.CharField(max_length=20, choices=Book.GENRE_CHOICES)
+    cohort = models.PositiveSmallIntegerField()  # year the member joined
+    borrow_count = models.PositiveIntegerField(default=0)
+    return_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['date', 'genre', 'cohort']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'genre', 'cohort'], name='unique_daily_circulation'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.genre} ({self.cohort}): {self.borrow_count} borrowed, {self.return_count} returned"
+
+class RollupState(models.Model):
+    # High-water mark of the last Transaction folded into the rollups
+    name = models.CharField(max_length=50, unique=True)
+    last_transaction_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_transaction_id}"
+
+
+class ChangeLog(models.Model):
+    # Append-only feed of catalog and circulation changes; the id is the sync cursor
+    ACTIONS = [
+        ('save', 'Save'),
+        ('delete', 'Delete'),
+    ]
+
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False)
+    action = models.CharField(max_length=10, choices=ACTIONS, default='save')
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['model', 'id'], name='changelog_model_cursor'),
+            models.Index(fields=['branch', 'id'], name='changelog_branch_cursor'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.model} {self.object_id}"
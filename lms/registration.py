@@ -0,0 +1,155 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db import transaction as db_transaction
+from django.db.models import F
+
+from .models import Member, MembershipSequence
+
+
+class MembershipIdAllocator:
+    """Hands out membership ids from blocks reserved in MembershipSequence.
+
+    Reserving a block is one short transaction on the sequence row; the ids
+    in it are then handed out from memory, so concurrent sign-ups don't all
+    contend on the same row. Ids left in a block when the process exits are
+    skipped, never reused.
+    """
+
+    def __init__(self, name='member', prefix='M', block_size=None):
+        self.name = name
+        self.prefix = prefix
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def format(self, number):
+        # Fits Member.membership_id (max_length=10)
+        return f"{self.prefix}{number:09d}"
+
+    def reserve(self, size):
+        """Reserve `size` consecutive numbers and return the first one.
+
+        Must not run inside another transaction: if that one rolled back, the
+        block would be handed out again by another process.
+        """
+        with db_transaction.atomic(using=DEFAULT_DB_ALIAS):
+            MembershipSequence.objects.get_or_create(name=self.name)
+            MembershipSequence.objects.filter(name=self.name).update(next_value=F('next_value') + size)
+            end = MembershipSequence.objects.get(name=self.name).next_value
+        return end - size
+
+    def allocate(self):
+        with self._lock:
+            if self._next >= self._end:
+                size = self.block_size or getattr(settings, 'LMS_MEMBERSHIP_ID_BLOCK_SIZE', 100)
+                self._next = self.reserve(size)
+                self._end = self._next + size
+            number = self._next
+            self._next += 1
+        return self.format(number)
+
+    def allocate_many(self, count):
+        start = self.reserve(count)
+        return [self.format(number) for number in range(start, start + count)]
+
+
+membership_ids = MembershipIdAllocator()
+
+
+def register_member(form, allocator=membership_ids):
+    """Create the User from a valid UserRegisterForm and its Member profile atomically."""
+    # Allocated first, outside the transaction (see MembershipIdAllocator.reserve)
+    membership_id = allocator.allocate()
+    with db_transaction.atomic():
+        user = form.save()
+        Member.objects.create(user=user, membership_id=membership_id)
+    return user
+
+
+def _init_hash_worker():
+    # Worker processes started with "spawn" need their own app registry
+    django.setup()
+
+
+def hashing_pool(workers=None):
+    """Process pool for hash_passwords(), to be shared across several calls.
+
+    Starting the pool (and django.setup() in every worker) is not free, so
+    callers hashing in batches should create it once.
+    """
+    if workers == 1:
+        return nullcontext()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_hash_worker)
+
+
+def hash_passwords(passwords, workers=None, pool=None):
+    """make_password() for many passwords, spread over a process pool.
+
+    Uses `pool` if given, otherwise a pool started for this call. Empty
+    passwords become unusable passwords.
+    """
+    passwords = [p or None for p in passwords]
+    if workers == 1 or len(passwords) < 2:
+        return [make_password(p) for p in passwords]
+    if pool is None:
+        with hashing_pool(workers) as pool:
+            return hash_passwords(passwords, workers=workers, pool=pool)
+    chunksize = max(1, len(passwords) // ((workers or os.cpu_count() or 4) * 4))
+    return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def import_members(rows, workers=None, allocator=membership_ids, pool=None):
+    """Bulk-create users and members from roster rows.
+
+    Each row is a dict with `username` and optionally `first_name`,
+    `last_name`, `email`, `password`, `phone` and `address`. Rows whose
+    username already exists are skipped. Passwords are hashed in `pool`
+    (see hashing_pool) if given. Returns (created, skipped usernames).
+    """
+    usernames = [row['username'] for row in rows]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    seen = set()
+    new_rows = []
+    for row in rows:
+        if row['username'] in existing or row['username'] in seen:
+            continue
+        seen.add(row['username'])
+        new_rows.append(row)
+    skipped = [u for u in usernames if u in existing]
+    if not new_rows:
+        return 0, skipped
+
+    hashes = hash_passwords([row.get('password', '') for row in new_rows], workers=workers, pool=pool)
+    ids = allocator.allocate_many(len(new_rows))
+
+    with db_transaction.atomic():
+        User.objects.bulk_create([
+            User(
+                username=row['username'],
+                first_name=row.get('first_name', ''),
+                last_name=row.get('last_name', ''),
+                email=row.get('email', ''),
+                password=password,
+            )
+            for row, password in zip(new_rows, hashes)
+        ])
+        # Re-read the ids; not every backend returns them from bulk_create
+        user_ids = dict(User.objects.filter(username__in=seen).values_list('username', 'id'))
+        Member.objects.bulk_create([
+            Member(
+                user_id=user_ids[row['username']],
+                membership_id=membership_id,
+                phone=row.get('phone', ''),
+                address=row.get('address', ''),
+            )
+            for row, membership_id in zip(new_rows, ids)
+        ])
+    return len(new_rows), skipped
@@ -0,0 +1,42 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from .branches import current_branch, get_branch
+from .models import Branch
+
+# Catalog and loans are placed per branch; everything else stays in the default database
+SHARDED_MODELS = {'book', 'transaction'}
+
+
+class BranchRouter:
+    def _db_for_model(self, model, **hints):
+        if model._meta.app_label != 'lms':
+            return None
+        if model._meta.model_name not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+
+        instance = hints.get('instance')
+        if isinstance(instance, Branch):
+            # Assigning or following a branch relation, e.g. Book(branch=...) or branch.books
+            return instance.database
+        if instance is not None and instance._meta.model_name in SHARDED_MODELS:
+            if instance._state.db:
+                return instance._state.db
+            branch = get_branch(getattr(instance, 'branch_id', None))
+            if branch is not None:
+                return branch.database
+
+        branch = current_branch()
+        if branch is not None:
+            return branch.database
+        return None
+
+    db_for_read = _db_for_model
+    db_for_write = _db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Branches and members are referenced across databases without FK constraints
+        global_models = {'branch', 'member'}
+        for obj in (obj1, obj2):
+            if obj._meta.app_label == 'lms' and obj._meta.model_name in global_models:
+                return True
+        return None
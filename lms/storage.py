@@ -0,0 +1,68 @@
+import gzip
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always generated
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot'}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Content-hashed static files with pre-compressed .gz/.br siblings.
+
+    The siblings are written once at collectstatic time so the static file
+    middleware can serve them without compressing per request.
+    """
+
+    def stored_name(self, name):
+        # Templates reference a few optional images (images/*.jpg) that are not
+        # in the static sources; fall back to the plain URL for those instead of
+        # failing the whole page. A file that does exist but is missing from the
+        # manifest means collectstatic did not run with this storage, so raise.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if finders.find(name):
+                raise
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            for compressed_name in self.compress(name):
+                yield name, compressed_name, True
+
+    def compress(self, name):
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        if not self.exists(name):
+            return
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < getattr(settings, 'LMS_STATIC_COMPRESS_MIN_SIZE', 200):
+            return
+
+        # mtime=0 keeps the .gz bytes identical between deploys
+        encoders = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append(('.br', lambda d: brotli.compress(d)))
+
+        for suffix, encode in encoders:
+            compressed = encode(data)
+            # Not worth serving if it barely shrinks (already compressed formats)
+            if len(compressed) >= len(data) * 0.95:
+                continue
+            path = self.path(name) + suffix
+            with open(path, 'wb') as f:
+                f.write(compressed)
+            yield name + suffix
@@ -0,0 +1,188 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .branches import get_branch_by_code
+from .changes import record_changes
+from .events import publish_availability
+from .models import Book, Member, Transaction
+
+FINE_PER_DAY = Decimal('1.00')
+
+
+# String fields of an event; other types (or missing values) are reported as conflicts
+EVENT_FIELDS = ('sync_id', 'type', 'branch', 'isbn', 'membership_id')
+
+
+def _recorded_at(event):
+    """The event's recorded_at as an aware datetime, or now if it has none.
+
+    Raises ValueError if the value is not a valid ISO 8601 datetime.
+    """
+    value = event.get('recorded_at')
+    if value is None:
+        return timezone.now()
+    recorded = parse_datetime(value) if isinstance(value, str) else None
+    if recorded is None:
+        raise ValueError('not an ISO 8601 datetime')
+    if timezone.is_naive(recorded):
+        recorded = timezone.make_aware(recorded)
+    return recorded
+
+
+def _validate(event):
+    # Returns (recorded_at, None) for a well-formed event, or (None, reason)
+    if not isinstance(event, dict):
+        return None, 'Event is not an object.'
+    for field in EVENT_FIELDS:
+        if not isinstance(event.get(field), str) or not event[field]:
+            return None, f'Missing or invalid {field}.'
+    try:
+        return _recorded_at(event), None
+    except ValueError as e:
+        # Also raised by parse_datetime for impossible dates such as Feb 30
+        return None, f"Invalid recorded_at {event.get('recorded_at')!r}: {e}"
+
+
+def apply_offline_events(events, dry_run=False):
+    """Apply borrows and returns recorded by an offline desk.
+
+    Each event is a dict with `sync_id`, `type` ('borrow' or 'return'),
+    `branch` (code), `isbn`, `membership_id` and optionally `recorded_at`.
+    Events are applied in recorded order, per branch database, in one
+    transaction. A borrow conflicts when no copy is left on the shelf and a
+    return conflicts when the member has no open loan for the book; those
+    events are skipped and reported, as are malformed events (not an object,
+    missing fields or an invalid recorded_at). Events whose sync_id was
+    already applied are reported as duplicates.
+
+    Returns a dict with `applied`, `duplicates` and `conflicts`.
+    """
+    result = {'applied': 0, 'duplicates': [], 'conflicts': []}
+
+    def conflict(event, reason):
+        sync_id = event.get('sync_id') if isinstance(event, dict) else None
+        result['conflicts'].append({'sync_id': sync_id, 'reason': reason})
+
+    # A malformed record from one desk is reported, not allowed to stop the batch
+    valid = []
+    for event in events:
+        recorded_at, reason = _validate(event)
+        if reason:
+            conflict(event, reason)
+        else:
+            valid.append((recorded_at, event))
+
+    members = {
+        m.membership_id: m
+        for m in Member.objects.filter(membership_id__in={e['membership_id'] for _, e in valid})
+    }
+
+    by_database = {}
+    for recorded_at, event in sorted(valid, key=lambda item: item[0]):
+        branch = get_branch_by_code(event['branch'])
+        if event['type'] not in ('borrow', 'return'):
+            conflict(event, f"Unknown event type: {event['type']}")
+        elif branch is None:
+            conflict(event, f"Unknown branch: {event['branch']}")
+        elif event['membership_id'] not in members:
+            conflict(event, f"Unknown member: {event['membership_id']}")
+        else:
+            by_database.setdefault(branch.database, []).append((event, branch, recorded_at))
+
+    for alias, branch_events in by_database.items():
+        with db_transaction.atomic(using=alias):
+            _apply(alias, branch_events, members, result, conflict, dry_run)
+            if dry_run:
+                db_transaction.set_rollback(True, using=alias)
+    return result
+
+
+def _apply(alias, branch_events, members, result, conflict, dry_run):
+    transactions = Transaction.objects.using(alias)
+    sync_ids = [event['sync_id'] for event, _, _ in branch_events]
+    seen = set(transactions.filter(sync_id__in=sync_ids).values_list('sync_id', flat=True))
+
+    books = {
+        (book.branch_id, book.isbn): book
+        for book in Book.objects.using(alias).select_for_update().filter(
+            branch__in={branch for _, branch, _ in branch_events},
+            isbn__in={event['isbn'] for event, _, _ in branch_events},
+        )
+    }
+    open_loans = {}
+    for loan in transactions.filter(
+        book__in=books.values(),
+        member__in={members[event['membership_id']] for event, _, _ in branch_events},
+        transaction_type='borrow',
+        is_returned=False,
+    ).order_by('transaction_date'):
+        open_loans.setdefault((loan.book_id, loan.member_id), []).append(loan)
+
+    new_transactions = []
+    returned_loans = []
+    changed_books = {}
+    for event, branch, recorded_at in branch_events:
+        if event['sync_id'] in seen:
+            result['duplicates'].append(event['sync_id'])
+            continue
+        book = books.get((branch.id, event['isbn']))
+        if book is None:
+            conflict(event, f"{branch} has no book with ISBN {event['isbn']}.")
+            continue
+        member = members[event['membership_id']]
+        day = timezone.localtime(recorded_at).date()
+
+        if event['type'] == 'borrow':
+            if book.available_copies <= 0:
+                conflict(event, f'No copies of "{book.title}" were available.')
+                continue
+            book.available_copies -= 1
+            loan = Transaction(
+                book=book, member=member, branch=branch, transaction_type='borrow',
+                due_date=day + timedelta(days=14), sync_id=event['sync_id'],
+            )
+            loan.recorded_at = recorded_at
+            new_transactions.append(loan)
+            open_loans.setdefault((book.id, member.id), []).append(loan)
+        else:
+            loans = open_loans.get((book.id, member.id))
+            if not loans:
+                conflict(event, f'{member} has no open loan of "{book.title}".')
+                continue
+            loan = loans.pop(0)
+            loan.is_returned = True
+            loan.return_date = day
+            if loan.pk:
+                returned_loans.append(loan)
+            book.available_copies += 1
+            days_overdue = (day - loan.due_date).days
+            record = Transaction(
+                book=book, member=member, branch=branch, transaction_type='return',
+                due_date=loan.due_date, return_date=day, is_returned=True,
+                fine_amount=FINE_PER_DAY * days_overdue if days_overdue > 0 else 0,
+                sync_id=event['sync_id'],
+            )
+            record.recorded_at = recorded_at
+            new_transactions.append(record)
+
+        # Same rule as Book.save(), which bulk_update bypasses
+        book.status = 'available' if book.available_copies > 0 else 'borrowed'
+        changed_books[book.pk] = book
+        seen.add(event['sync_id'])
+        result['applied'] += 1
+
+    transactions.bulk_create(new_transactions)
+    # transaction_date is auto_now_add; keep the time the desk recorded instead
+    for t in new_transactions:
+        t.transaction_date = t.recorded_at
+    transactions.bulk_update(new_transactions, ['transaction_date'])
+    transactions.bulk_update(returned_loans, ['is_returned', 'return_date'])
+    Book.objects.using(alias).bulk_update(changed_books.values(), ['available_copies', 'status'])
+
+    if not dry_run:
+        record_changes(list(changed_books.values()) + new_transactions + returned_loans)
+        publish_availability(changed_books.values())
@@ -1,3 +1,620 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection
+from django.db.models import ProtectedError
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, branches
+from .analytics import backfill_rollups, circulation_summary, linear_trend, percentile, update_rollups
+from .branches import clear_branch_cache, fan_out, get_branch_by_code, search_books, transfer_copies
+from .events import availability_events, broker
+from .middleware import StaticFilesMiddleware
+from .sync import apply_offline_events
+from .models import Book, Branch, ChangeLog, DailyCirculation, Member, MembershipSequence, Transaction
+from .registration import MembershipIdAllocator, import_members
+
+
+def make_book(isbn='9780000000001', genre='fiction', copies=5, **kwargs):
+    return Book.objects.create(
+        title=kwargs.pop('title', f'Book {isbn}'), author='Author', isbn=isbn, genre=genre,
+        total_copies=copies, available_copies=copies, **kwargs
+    )
+
+def make_member(username='reader', **kwargs):
+    user = User.objects.create_user(username=username, password='pass12345', **kwargs)
+    return Member.objects.create(user=user, membership_id=f"M{user.id:04d}")
+
+def make_transaction(book, member, transaction_type='borrow', when=None):
+    t = Transaction.objects.create(
+        book=book, member=member, transaction_type=transaction_type,
+        due_date=date.today() + timedelta(days=14), is_returned=transaction_type == 'return'
+    )
+    if when is not None:
+        Transaction.objects.filter(pk=t.pk).update(transaction_date=when)
+    return t
+
+
+class CirculationRollupTests(TestCase):
+    def setUp(self):
+        self.book = make_book(genre='science')
+        self.member = make_member()
+        self.today = timezone.localdate()
+        self.yesterday = timezone.make_aware(datetime.combine(self.today - timedelta(days=1), datetime.min.time()))
+
+    def test_incremental_update_only_counts_new_transactions(self):
+        make_transaction(self.book, self.member, when=self.yesterday)
+        make_transaction(self.book, self.member, 'return', when=self.yesterday)
+        self.assertEqual(update_rollups(), 2)
+
+        make_transaction(self.book, self.member)
+        self.assertEqual(update_rollups(batch_size=1), 1)
+        self.assertEqual(update_rollups(), 0)
+
+        rollup = DailyCirculation.objects.get(date=self.yesterday.date())
+        self.assertEqual((rollup.genre, rollup.borrow_count, rollup.return_count), ('science', 1, 1))
+        self.assertEqual(rollup.cohort, self.member.date_joined.year)
+        self.assertEqual(DailyCirculation.objects.get(date=self.today).borrow_count, 1)
+
+    def test_backfill_is_idempotent_and_does_not_double_count(self):
+        make_transaction(self.book, self.member, when=self.yesterday)
+        make_transaction(self.book, self.member)
+        backfill_rollups(chunk_days=1)
+        backfill_rollups(chunk_days=1)
+        self.assertEqual(update_rollups(), 0)
+
+        summary = circulation_summary(days=2)
+        self.assertEqual(summary['borrows'], [1, 1])
+        self.assertEqual(summary['by_genre'], [{'label': 'Science', 'borrows': 2}])
+
+    def test_backfill_keeps_transactions_rolled_up_while_it_runs(self):
+        make_transaction(self.book, self.member, when=self.yesterday)
+        make_transaction(self.book, self.member)
+        merge = analytics._merge
+
+        def merge_then_update(counts):
+            # The cron job folds in a new loan between two backfill chunks
+            merge(counts)
+            if Transaction.objects.count() == 2:
+                make_transaction(self.book, self.member)
+                update_rollups()
+
+        with mock.patch.object(analytics, '_merge', merge_then_update):
+            self.assertEqual(backfill_rollups(chunk_days=1), 2)
+        self.assertEqual(circulation_summary(days=2)['borrows'], [1, 2])
+
+    def test_backfill_chunks_use_the_transaction_date_index(self):
+        make_transaction(self.book, self.member, when=self.yesterday)
+        chunks = []
+        aggregate = analytics._aggregate
+
+        def capture(transactions):
+            chunks.append(transactions.explain())
+            return aggregate(transactions)
+
+        with mock.patch.object(analytics, '_aggregate', capture):
+            backfill_rollups(chunk_days=1)
+        self.assertTrue(chunks)
+        for plan in chunks:
+            self.assertRegex(plan, r'USING INDEX \w*transaction_date\w* \(transaction_date>\? AND transaction_date<\?\)')
+
+    def test_array_statistics(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertEqual(percentile([], 90), 0.0)
+        self.assertAlmostEqual(linear_trend([1, 3, 5, 7]), 2.0)
+        self.assertEqual(linear_trend([4]), 0.0)
+
+
+class BranchTests(TestCase):
+    def setUp(self):
+        self.main = Branch.objects.create(code='main', name='Main Library')
+        self.east = Branch.objects.create(code='east', name='East Branch')
+        self.book = make_book(isbn='9780000000002', copies=3, branch=self.main, title='Dune')
+
+    def test_transfer_creates_catalog_entry_in_target_branch(self):
+        target = transfer_copies(self.book, self.east, copies=2)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.total_copies), (1, 1))
+        self.assertEqual((target.branch, target.isbn, target.available_copies), (self.east, self.book.isbn, 2))
+
+        transfer_copies(self.book, self.east)
+        target.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertEqual(target.total_copies, 3)
+        self.assertEqual(self.book.status, 'borrowed')
+
+    def test_transfer_rejects_more_copies_than_available(self):
+        with self.assertRaises(ValueError):
+            transfer_copies(self.book, self.east, copies=4)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 3)
+
+    def test_book_list_searches_all_branches_or_the_selected_one(self):
+        make_book(isbn='9780000000002', branch=self.east, title='Dune')
+        self.assertEqual([b.branch_code for b in search_books('dune')], ['east', 'main'])
+
+        response = self.client.get('/books/', {'q': 'dune', 'branch': 'east'})
+        self.assertEqual([b.branch for b in response.context['books']], [self.east])
+        response = self.client.get('/books/', {'q': 'dune'})
+        self.assertEqual(len(response.context['books']), 1)
+        response = self.client.get('/books/', {'q': 'dune', 'branch': 'all'})
+        self.assertEqual(len(response.context['books']), 2)
+
+    def test_links_to_a_branch_book_do_not_change_the_selected_branch(self):
+        east_book = make_book(isbn='9780000000002', branch=self.east, title='Dune')
+        response = self.client.get(reverse('book_detail', args=[east_book.pk]), {'at': 'east'})
+        self.assertEqual(response.context['book'], east_book)
+        self.assertNotIn('branch', self.client.session)
+        self.assertEqual(len(self.client.get('/books/', {'q': 'dune'}).context['books']), 2)
+
+        response = self.client.get('/books/', {'q': 'dune', 'branch': 'east'})
+        self.assertContains(response, '?at=east')
+        self.assertEqual(self.client.session['branch'], 'east')
+
+    def test_branch_cache_expires_for_changes_made_by_other_workers(self):
+        self.assertEqual(get_branch_by_code('east'), self.east)
+        # A queryset update sends no signals, like a save in another process
+        Branch.objects.filter(pk=self.east.pk).update(code='west')
+        self.assertEqual(get_branch_by_code('east'), self.east)
+        with self.settings(LMS_BRANCH_CACHE_TTL=0):
+            clear_branch_cache()
+            self.assertEqual(get_branch_by_code('west'), self.east)
+            Branch.objects.filter(pk=self.east.pk).update(code='north')
+            self.assertEqual(get_branch_by_code('north'), self.east)
+
+    def test_loans_inherit_the_book_branch(self):
+        loan = make_transaction(self.book, make_member())
+        self.assertEqual(loan.branch, self.main)
+
+
+# Provided by library_project.test_settings, which manage.py test uses by default
+HAS_EAST_DATABASE = 'east' in settings.DATABASES
+
+
+@skipUnless(HAS_EAST_DATABASE, "Needs the 'east' database from library_project.test_settings.")
+class MultiDatabaseBranchTests(TransactionTestCase):
+    # Fan-out threads open their own connections, so the rows must be committed
+    databases = {'default', 'east'} if HAS_EAST_DATABASE else {'default'}
+    reset_sequences = True
+
+    def setUp(self):
+        self.main = Branch.objects.create(code='main', name='Main Library')
+        self.east = Branch.objects.create(code='east', name='East Branch', database='east')
+        self.book = make_book(isbn='9780000000005', copies=3, branch=self.main, title='Dune')
+        # The flush after each test sends no signals, so the cached branches would outlive it
+        self.addCleanup(clear_branch_cache)
+        self.member = make_member()
+
+    def test_branch_catalog_and_loans_are_routed_to_its_database(self):
+        book = make_book(isbn='9780000000006', branch=self.east, title='Emma')
+        self.assertEqual(book._state.db, 'east')
+        self.assertFalse(Book.objects.using('default').filter(isbn=book.isbn).exists())
+
+        loan = make_transaction(book, self.member)
+        self.assertEqual((loan._state.db, loan.branch), ('east', self.east))
+        self.assertEqual(Transaction.objects.using('east').get().member, self.member)
+        self.assertFalse(Transaction.objects.using('default').exists())
+
+    def test_transfer_moves_copies_to_another_database(self):
+        target = transfer_copies(self.book, self.east, copies=2)
+        self.assertEqual(target._state.db, 'east')
+        self.assertEqual(Book.objects.using('east').get(isbn=self.book.isbn).available_copies, 2)
+        self.assertEqual(Book.objects.using('default').get(pk=self.book.pk).total_copies, 1)
+
+    def test_search_fans_out_through_the_thread_pool(self):
+        make_book(isbn='9780000000005', branch=self.east, title='Dune')
+        books = search_books('dune')
+        threads = fan_out(lambda alias: threading.current_thread().name)
+        self.assertTrue(all(name.startswith('lms-fan-out') for name in threads))
+        # One pool per process, shared by every request
+        self.assertIs(branches._fan_out_executor(), branches._fan_out_executor())
+        self.assertEqual([(b.branch_code, b._state.db) for b in books], [('east', 'east'), ('main', 'default')])
+
+    def test_home_totals_cover_every_branch_database(self):
+        make_book(isbn='9780000000006', branch=self.east, title='Emma', copies=0)
+        response = self.client.get('/')
+        self.assertEqual((response.context['total_books'], response.context['available_books']), (2, 1))
+        self.assertContains(response, '?at=east')
+        response = self.client.get('/', {'branch': 'east'})
+        self.assertEqual([b.title for b in response.context['books']], ['Emma'])
+
+    def test_deletes_apply_across_branch_databases(self):
+        east_book = make_book(isbn='9780000000006', branch=self.east, title='Emma')
+        make_transaction(east_book, self.member)
+        self.member.user.delete()
+        self.assertFalse(Transaction.objects.using('east').exists())
+
+        with self.assertRaises(ProtectedError):
+            self.east.delete()
+        admin_user = User.objects.create_superuser(username='admin', password='pass12345')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:lms_branch_delete', args=[self.east.pk]))
+        self.assertEqual(response.context['protected'], ['Book: Emma by Author'])
+
+        east_book.delete()
+        self.east.delete()
+        self.assertFalse(Branch.objects.filter(code='east').exists())
+
+    def test_returns_without_a_selected_branch_reach_every_database(self):
+        east_book = make_book(isbn='9780000000006', branch=self.east, title='Emma')
+        # Loan ids overlap between databases; /return/1/ must pick the user's own loan
+        make_transaction(self.book, make_member(username='other'))
+        loans = [make_transaction(self.book, self.member), make_transaction(east_book, self.member)]
+        self.assertEqual(loans[1].pk, 1)
+        self.client.force_login(self.member.user)
+        self.assertEqual(len(self.client.get('/profile/').context['current_transactions']), 2)
+
+        self.client.post(f'/return/{loans[1].pk}/')
+        self.assertTrue(Transaction.objects.using('east').get(pk=loans[1].pk).is_returned)
+        self.assertFalse(Transaction.objects.using('default').get(pk=loans[0].pk).is_returned)
+
+        make_transaction(east_book, self.member)
+        self.client.post('/return-all/')
+        for alias in ('default', 'east'):
+            open_loans = Transaction.objects.using(alias).filter(member=self.member, is_returned=False)
+            self.assertFalse(open_loans.exists())
+
+
+class StaticFilesMiddlewareTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        os.makedirs(os.path.join(self.root.name, 'css'))
+        self.css = b'body { color: black; }\n' * 50
+        for name, data in [('site.0123456789ab.css', self.css), ('site.css', self.css)]:
+            path = os.path.join(self.root.name, 'css', name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data))
+
+        with override_settings(LMS_SERVE_STATIC=True, STATIC_ROOT=self.root.name):
+            self.middleware = StaticFilesMiddleware(lambda request: HttpResponse('app'))
+        self.factory = RequestFactory()
+
+    def test_serves_compressed_variant_with_far_future_cache(self):
+        response = self.middleware(self.factory.get('/static/css/site.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.css)
+
+        response = self.middleware(self.factory.get(
+            '/static/css/site.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']
+        ))
+        self.assertEqual(response.status_code, 304)
+
+    def test_negotiates_encoding_and_etag_per_variant(self):
+        url = '/static/css/site.0123456789ab.css'
+        plain = self.middleware(self.factory.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, xbrx'))
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        gzipped = self.middleware(self.factory.get(url, HTTP_ACCEPT_ENCODING='deflate, *;q=0.5'))
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertNotEqual(plain['ETag'], gzipped['ETag'])
+
+        response = self.middleware(self.factory.get(
+            url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=f'"other", W/{gzipped["ETag"]}'
+        ))
+        self.assertEqual(response.status_code, 304)
+        response = self.middleware(self.factory.get(url, HTTP_IF_NONE_MATCH=gzipped['ETag']))
+        self.assertEqual(response.status_code, 200)
+
+    def test_unhashed_and_unknown_files(self):
+        response = self.middleware(self.factory.get('/static/css/site.css'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Cache-Control'], 'max-age=60, public')
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+
+        response = self.middleware(self.factory.get('/static/css/missing.css'))
+        self.assertEqual(response.content, b'app')
+
+
+class CompressedManifestStorageTests(TestCase):
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        self.source = source.name
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(self.root.cleanup)
+        self.css = b'.cover { background: url("../img/logo.png"); }\n' + b'body { color: black; }\n' * 50
+        files = {
+            'css/site.css': self.css,
+            'img/logo.png': b'\x89PNG' + bytes(300),
+            'js/tiny.js': b'init();\n',
+            # Random bytes barely compress, so no sibling is worth writing
+            'data/noise.txt': os.urandom(2000),
+        }
+        for name, data in files.items():
+            path = os.path.join(source.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'lms.storage.CompressedManifestStaticFilesStorage'},
+        }
+        overrides = override_settings(
+            STATIC_ROOT=self.root.name, STATICFILES_DIRS=[source.name], STORAGES=storages,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def collected(self, name):
+        return os.path.exists(os.path.join(self.root.name, name))
+
+    def test_collectstatic_writes_hashed_names_and_compressed_siblings(self):
+        css_name = staticfiles_storage.stored_name('css/site.css')
+        self.assertRegex(css_name, r'^css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root.name, css_name + '.gz'), 'rb') as f:
+            css = gzip.decompress(f.read())
+        self.assertIn(f"../{staticfiles_storage.stored_name('img/logo.png')}".encode(), css)
+
+        self.assertFalse(self.collected('img/logo.png.gz'))
+        self.assertFalse(self.collected(staticfiles_storage.stored_name('js/tiny.js') + '.gz'))
+        self.assertFalse(self.collected(staticfiles_storage.stored_name('data/noise.txt') + '.gz'))
+        self.assertEqual(staticfiles_storage.stored_name('img/missing.png'), 'img/missing.png')
+
+    def test_files_missing_from_the_manifest_are_errors(self):
+        # In the static sources but not collected, e.g. collectstatic ran with the plain storage
+        with open(os.path.join(self.source, 'css', 'late.css'), 'w') as f:
+            f.write('body {}')
+        with self.assertRaisesMessage(ValueError, 'Missing staticfiles manifest entry'):
+            staticfiles_storage.stored_name('css/late.css')
+
+    def test_middleware_serves_collected_files(self):
+        with self.settings(LMS_SERVE_STATIC=True):
+            middleware = StaticFilesMiddleware(lambda request: HttpResponse('app'))
+        response = middleware(RequestFactory().get(
+            staticfiles_storage.url('css/site.css'), HTTP_ACCEPT_ENCODING='gzip, br'
+        ))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(b'body { color: black; }', gzip.decompress(b''.join(response.streaming_content)))
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(code='main', name='Main Library')
+        self.book = make_book(isbn='9780000000003', copies=1, branch=self.branch)
+        self.member = make_member()
+        self.staff = User.objects.create_user(username='desk', password='pass12345', is_staff=True)
+
+    def event(self, sync_id, event_type, when):
+        return {
+            'sync_id': sync_id, 'type': event_type, 'branch': 'main', 'isbn': self.book.isbn,
+            'membership_id': self.member.membership_id, 'recorded_at': when,
+        }
+
+    def test_feed_pages_through_changes_by_cursor(self):
+        self.book.available_copies = 0
+        self.book.save()
+
+        self.client.force_login(self.staff)
+        first = self.client.get('/api/changes/', {'since': 0, 'limit': 1}).json()
+        self.assertTrue(first['has_more'])
+        second = self.client.get('/api/changes/', {'since': first['cursor'], 'model': 'book'}).json()
+        self.assertFalse(second['has_more'])
+        self.assertEqual(second['changes'][-1]['data']['available_copies'], 0)
+        self.assertEqual(self.client.get('/api/changes/', {'since': 'x'}).status_code, 400)
+
+        self.client.force_login(self.member.user)
+        self.assertEqual(self.client.get('/api/changes/').status_code, 403)
+
+    def test_sync_detects_availability_conflicts_and_duplicates(self):
+        other = make_member(username='other')
+        events = [
+            self.event('k1-1', 'borrow', '2026-01-05T10:00:00Z'),
+            dict(self.event('k2-1', 'borrow', '2026-01-05T10:05:00Z'), membership_id=other.membership_id),
+            self.event('k1-2', 'return', '2026-01-25T09:00:00Z'),
+        ]
+        cursor = ChangeLog.objects.last().id
+        result = apply_offline_events(events)
+        self.assertEqual(result['applied'], 2)
+        self.assertEqual([c['sync_id'] for c in result['conflicts']], ['k2-1'])
+
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.status), (1, 'available'))
+        record = Transaction.objects.get(sync_id='k1-2')
+        self.assertEqual(record.fine_amount, 6)
+        self.assertEqual(record.transaction_date.date(), date(2026, 1, 25))
+        self.assertTrue(Transaction.objects.get(sync_id='k1-1').is_returned)
+        self.assertEqual(ChangeLog.objects.filter(id__gt=cursor, model='transaction').count(), 2)
+
+        self.assertEqual(apply_offline_events(events[:1])['duplicates'], ['k1-1'])
+
+
+    def test_sync_reports_malformed_events_without_stopping_the_batch(self):
+        events = [
+            'not an event',
+            self.event('k1-1', 'borrow', '2026-02-30T10:00:00'),
+            self.event('k1-2', 'borrow', 'yesterday'),
+            dict(self.event('k1-3', 'borrow', None), isbn=9780000000003),
+            self.event('k1-4', 'borrow', '2026-02-27T10:00:00'),
+        ]
+        result = apply_offline_events(events)
+        self.assertEqual(result['applied'], 1)
+        self.assertEqual([c['sync_id'] for c in result['conflicts']], [None, 'k1-1', 'k1-2', 'k1-3'])
+        self.assertIn('day is out of range', result['conflicts'][1]['reason'])
+        self.assertTrue(Transaction.objects.filter(sync_id='k1-4').exists())
+
+
+class AdminChangelistQueryBudgetTests(TestCase):
+    # Queries per changelist page, independent of the number of rows shown
+    BUDGETS = {
+        '/admin/lms/book/': 10,
+        '/admin/lms/member/': 10,
+        '/admin/lms/transaction/': 14,
+    }
+
+    def setUp(self):
+        self.branch = Branch.objects.create(code='main', name='Main Library')
+        self.admin = User.objects.create_superuser(username='admin', password='pass12345')
+        self.client.force_login(self.admin)
+
+    def add_rows(self, start, count):
+        for i in range(start, start + count):
+            book = make_book(isbn=f'978{i:010d}', branch=self.branch)
+            member = make_member(username=f'reader{i}', first_name='Reader', last_name=str(i))
+            make_transaction(book, member)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_changelists_stay_within_query_budget(self):
+        self.add_rows(0, 3)
+        few = {url: self.count_queries(url) for url in self.BUDGETS}
+        self.add_rows(3, 20)
+        for url, budget in self.BUDGETS.items():
+            with self.subTest(url=url):
+                queries = self.count_queries(url)
+                self.assertLessEqual(queries, budget)
+                self.assertEqual(queries, few[url])
+
+    def test_cursor_pagination_and_indexed_search(self):
+        self.add_rows(0, 5)
+        loans = list(Transaction.objects.order_by('-pk'))
+        with self.settings(LMS_ADMIN_COUNT_LIMIT=3):
+            response = self.client.get('/admin/lms/transaction/', {'cursor': loans[1].pk})
+        cl = response.context['cl']
+        self.assertEqual(list(cl.result_list), loans[2:])
+        self.assertEqual(cl.result_count, 3)
+
+        member = loans[0].member
+        for term in (member.membership_id, member.user.username, loans[0].book.isbn):
+            response = self.client.get('/admin/lms/transaction/', {'q': term})
+            self.assertEqual(list(response.context['cl'].result_list), [loans[0]])
+
+
+    def test_search_uses_indexes(self):
+        self.add_rows(0, 3)
+        book = make_book(isbn='080442957X', branch=self.branch, title='Dune')
+        member = Member.objects.first()
+        request = RequestFactory().get('/')
+        searches = [
+            (Book, 'du', [book]),
+            (Book, '0-8044-2957-x', [book]),
+            (Member, member.user.username, [member]),
+            (Transaction, member.membership_id, list(Transaction.objects.filter(member=member))),
+            (Transaction, 'book 978', list(Transaction.objects.all())),
+        ]
+        for model, term, expected in searches:
+            with self.subTest(model=model.__name__, term=term):
+                queryset, _ = admin.site._registry[model].get_search_results(request, model.objects.all(), term)
+                self.assertCountEqual(queryset, expected)
+                self.assertNotRegex(queryset.explain(), r'\bSCAN (lms|auth)_')
+
+@override_settings(LMS_PASSWORD_ITERATIONS=1000)
+class RegistrationTests(TestCase):
+    def test_allocator_reserves_blocks(self):
+        allocator = MembershipIdAllocator(name='test', block_size=3)
+        ids = [allocator.allocate() for _ in range(4)]
+        self.assertEqual(ids, ['M000000001', 'M000000002', 'M000000003', 'M000000004'])
+        self.assertEqual(MembershipSequence.objects.get(name='test').next_value, 7)
+        self.assertEqual(MembershipIdAllocator(name='test').allocate_many(2), ['M000000007', 'M000000008'])
+
+    def test_register_creates_user_and_member(self):
+        response = self.client.post('/register/', {
+            'username': 'newreader', 'first_name': 'New', 'last_name': 'Reader',
+            'email': 'new@example.com', 'password1': 'Quill-Harbor-7341', 'password2': 'Quill-Harbor-7341',
+        })
+        self.assertRedirects(response, '/login/')
+        member = Member.objects.get(user__username='newreader')
+        self.assertRegex(member.membership_id, r'^M\d{9}$')
+        self.assertTrue(member.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_import_members_skips_existing_usernames(self):
+        make_member(username='taken')
+        created, skipped = import_members([
+            {'username': 'taken'},
+            {'username': 'ada', 'first_name': 'Ada', 'password': 'Quill-Harbor-7341'},
+            {'username': 'bob'},
+        ], workers=1)
+        self.assertEqual((created, skipped), (2, ['taken']))
+        ada = User.objects.get(username='ada')
+        self.assertTrue(ada.check_password('Quill-Harbor-7341'))
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+        self.assertNotEqual(ada.member.membership_id, User.objects.get(username='bob').member.membership_id)
+
+
+    def test_import_command_starts_one_hashing_pool_for_all_batches(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('username,password\nada,Quill-Harbor-7341\nbob,Quill-Harbor-7341\ncy,\n')
+        self.addCleanup(os.remove, f.name)
+        # Threads stand in for processes; the pool is what is being counted
+        with mock.patch('lms.registration.ProcessPoolExecutor', wraps=ThreadPoolExecutor) as pool:
+            call_command('import_members', f.name, batch_size=2, workers=2, stdout=io.StringIO())
+        pool.assert_called_once()
+        self.assertEqual(Member.objects.count(), 3)
+        self.assertTrue(User.objects.get(username='bob').check_password('Quill-Harbor-7341'))
+
+
+@override_settings(LMS_PASSWORD_ITERATIONS=1000, LMS_MEMBERSHIP_ID_BLOCK_SIZE=10)
+class RegistrationBenchmarkTests(TransactionTestCase):
+    # The threaded mode needs a file database: in-memory SQLite locks whole tables
+    def test_benchmark_commits_sign_ups_and_cleans_up(self):
+        out = io.StringIO()
+        call_command('bench_registration', count=6, workers=1, stdout=out)
+        self.assertIn('register view pipeline: 6 sign-ups', out.getvalue())
+        # One block for the sign-ups, six ids for the import, reserved in committed transactions
+        self.assertEqual(MembershipSequence.objects.get(name='benchmark').next_value, 1 + 10 + 6)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Member.objects.exists())
+
+
+class AvailabilityStreamTests(TestCase):
+    async def test_stream_sends_snapshot_then_pushed_updates(self):
+        book = await sync_to_async(make_book)(isbn='9780000000004', copies=2)
+        stream = availability_events('default', [book.pk], heartbeat=0.05)
+        self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+        snapshot = await anext(stream)
+        self.assertEqual(json.loads(snapshot.split('data: ')[1])['available_copies'], 2)
+        self.assertEqual(broker.watcher_count(), 1)
+
+        def borrow_last_copy():
+            # Published from a request thread, as the borrow view would
+            book.available_copies = 0
+            with self.captureOnCommitCallbacks(execute=True):
+                book.save()
+
+        await sync_to_async(borrow_last_copy)()
+        update = json.loads((await anext(stream)).split('data: ')[1])
+        self.assertEqual((update['available_copies'], update['status']), (0, 'borrowed'))
+
+        self.assertEqual(await anext(stream), ': keep-alive\n\n')
+        await stream.aclose()
+        self.assertEqual(broker.watcher_count(), 0)
+
+    async def test_rejects_bad_book_ids(self):
+        self.assertEqual((await self.async_client.get('/books/availability/', {'ids': 'x'})).status_code, 400)
+        self.assertEqual((await self.async_client.get('/books/availability/')).status_code, 400)
+
+    def test_stream_is_only_offered_over_asgi(self):
+        # Under WSGI the never-ending stream would hold a worker without sending anything
+        book = make_book(isbn='9780000000007')
+        self.assertEqual(self.client.get('/books/availability/', {'ids': book.pk}).status_code, 204)
+        self.assertNotContains(self.client.get(reverse('book_detail', args=[book.pk])), 'EventSource(')
+        response = async_to_sync(self.async_client.get)(reverse('book_detail', args=[book.pk]))
+        self.assertContains(response, 'EventSource(')
@@ -42,9 +42,11 @@ urlpatterns = [
     path('logout/', views.user_logout, name='logout'),
     path('profile/', views.profile, name='profile'),
     path('books/', views.book_list, name='book_list'),
+    path('books/availability/', views.availability_stream, name='availability_stream'),
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
     path('borrow/<int:book_id>/', views.borrow_book, name='borrow_book'),
     path('return/<int:transaction_id>/', views.return_book, name='return_book'),
     path('return-all/', views.bulk_return_books, name='bulk_return_books'),  # Optional
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('api/changes/', views.change_feed, name='change_feed'),
 ]
\ No newline at end of file
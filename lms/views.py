@@ -1,18 +1,42 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
+from django.db import DEFAULT_DB_ALIAS
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from .models import Book, Member, Transaction
 from .forms import UserRegisterForm, MemberUpdateForm, BookForm
+from .analytics import circulation_summary
+from .branches import all_branches, fan_out, search_books
+from .changes import changes_since
+from .events import availability_events
+from .registration import register_member
 from datetime import date, timedelta
 
 def home(request):
-    books = Book.objects.all()[:6]  # Show 6 recent books on homepage
+    # Selected branch only, otherwise summed over every branch database
+    def branch_books(alias):
+        books = Book.objects.using(alias)
+        if request.branch is not None:
+            books = books.filter(branch=request.branch)
+        return {
+            'books': list(books[:6]),
+            'total_books': books.count(),
+            'available_books': books.filter(status='available').count(),
+        }
+    
+    if request.branch is not None:
+        stats = [branch_books(request.branch.database)]
+    else:
+        stats = fan_out(branch_books)
     context = {
-        'books': books,
-        'total_books': Book.objects.count(),
-        'available_books': Book.objects.filter(status='available').count(),
+        'books': [book for s in stats for book in s['books']][:6],  # Show 6 recent books on homepage
+        'total_books': sum(s['total_books'] for s in stats),
+        'available_books': sum(s['available_books'] for s in stats),
     }
     return render(request, 'home.html', context)
 
@@ -20,14 +44,8 @@ def register(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            
-            # Create member profile
-            membership_id = f"M{user.id:04d}"
-            Member.objects.create(
-                user=user,
-                membership_id=membership_id
-            )
+            # Create the user and member profile together
+            register_member(form)
             
             username = form.cleaned_data.get('username')
             messages.success(request, f'Account created for {username}! You can now log in.')
@@ -69,16 +87,17 @@ def profile(request):
     else:
         u_form = MemberUpdateForm(instance=member)
     
-    # Get current and past transactions
-    current_transactions = Transaction.objects.filter(
-        member=member, 
-        transaction_type='borrow',
-        is_returned=False
+    # Get current and past transactions from every branch, in one query per branch
+    transactions = sorted(
+        (t for loans in fan_out(lambda alias: list(Transaction.objects.using(alias).filter(
+            member=member
+        ).select_related('book')))
+         for t in loans),
+        key=lambda t: t.transaction_date,
+        reverse=True
     )
-    
-    past_transactions = Transaction.objects.filter(
-        member=member
-    ).exclude(is_returned=False)
+    current_transactions = [t for t in transactions if t.transaction_type == 'borrow' and not t.is_returned]
+    past_transactions = [t for t in transactions if t.is_returned]
     
     context = {
         'u_form': u_form,
@@ -93,22 +112,28 @@ def book_list(request):
     query = request.GET.get('q')
     genre_filter = request.GET.get('genre')
     
-    books = Book.objects.all()
-    
-    if query:
-        books = books.filter(
-            Q(title__icontains=query) |
-            Q(author__icontains=query) |
-            Q(isbn__icontains=query)
-        )
-    
-    if genre_filter:
-        books = books.filter(genre=genre_filter)
+    if request.branch is None:
+        # No branch selected: search every branch database in parallel
+        books = search_books(query, genre_filter)
+    else:
+        books = Book.objects.filter(branch=request.branch)
+        
+        if query:
+            books = books.filter(
+                Q(title__icontains=query) |
+                Q(author__icontains=query) |
+                Q(isbn__icontains=query)
+            )
+        
+        if genre_filter:
+            books = books.filter(genre=genre_filter)
     
     context = {
         'books': books,
         'query': query,
         'genre_filter': genre_filter,
+        'branches': all_branches(),
+        'current_branch': request.branch,
     }
     return render(request, 'book_list.html', context)
 
@@ -145,7 +170,7 @@ def book_detail(request, book_id):
     if request.user.is_authenticated:
         try:
             member = get_object_or_404(Member, user=request.user)
-            current_borrow = Transaction.objects.filter(
+            current_borrow = Transaction.objects.using(book._state.db).filter(
                 book=book,
                 member=member,
                 transaction_type='borrow',
@@ -168,10 +193,17 @@ def book_detail(request, book_id):
         'current_transaction_id': current_transaction_id,
         'total_borrow_count': total_borrow_count,
         'popularity_score': popularity_score,
+        # The availability stream only works when served over ASGI
+        'live_availability': isinstance(request, ASGIRequest),
     }
     return render(request, 'book_detail.html', context)
 
 
+def book_detail_url(book):
+    # Book ids are only unique within one branch database
+    url = reverse('book_detail', args=[book.id])
+    return f'{url}?at={book.branch_code}' if book.branch_code else url
+
 @login_required
 def borrow_book(request, book_id):
     book = get_object_or_404(Book, id=book_id)
@@ -180,10 +212,10 @@ def borrow_book(request, book_id):
     # Check if book is available
     if book.available_copies <= 0:
         messages.error(request, 'Sorry, this book is not available for borrowing.')
-        return redirect('book_detail', book_id=book_id)
+        return redirect(book_detail_url(book))
     
     # Check if user already has this book borrowed
-    existing_borrow = Transaction.objects.filter(
+    existing_borrow = Transaction.objects.using(book._state.db).filter(
         book=book,
         member=member,
         transaction_type='borrow',
@@ -192,11 +224,11 @@ def borrow_book(request, book_id):
     
     if existing_borrow:
         messages.error(request, 'You have already borrowed this book.')
-        return redirect('book_detail', book_id=book_id)
+        return redirect(book_detail_url(book))
     
     # Create borrow transaction with due date (14 days from now)
     due_date = date.today() + timedelta(days=14)
-    Transaction.objects.create(
+    Transaction.objects.using(book._state.db).create(
         book=book,
         member=member,
         transaction_type='borrow',
@@ -249,9 +281,23 @@ def borrow_book(request, book_id):
 #     messages.success(request, f'You have successfully returned "{transaction.book.title}".')
 #     return redirect('profile')
 
+def find_loan(request, transaction_id):
+    # Loan ids are only unique within one branch database: without a selected
+    # branch, look in every branch and prefer the loan that belongs to the user
+    if request.branch is not None:
+        return get_object_or_404(Transaction.objects.using(request.branch.database), id=transaction_id)
+    
+    loans = [
+        t for found in fan_out(lambda alias: list(Transaction.objects.using(alias).filter(id=transaction_id)))
+        for t in found
+    ]
+    if not loans:
+        raise Http404('No Transaction matches the given query.')
+    return min(loans, key=lambda t: (t.member.user_id != request.user.id, t.is_returned))
+
 @login_required
 def return_book(request, transaction_id):
-    transaction = get_object_or_404(Transaction, id=transaction_id)
+    transaction = find_loan(request, transaction_id)
     
     # Verify that the current user owns this transaction
     if transaction.member.user != request.user:
@@ -276,10 +322,11 @@ def return_book(request, transaction_id):
     book.save()
     
     # Create return transaction record (without related_transaction)
-    Transaction.objects.create(
+    Transaction.objects.using(transaction._state.db).create(
         book=transaction.book,
         member=transaction.member,
-        transaction_type='return'
+        transaction_type='return',
+        due_date=transaction.due_date
     )
     
     messages.success(request, f'You have successfully returned "{transaction.book.title}".')
@@ -291,11 +338,15 @@ def return_book(request, transaction_id):
 def bulk_return_books(request):
     if request.method == 'POST':
         member = get_object_or_404(Member, user=request.user)
-        current_borrows = Transaction.objects.filter(
-            member=member,
-            transaction_type='borrow',
-            is_returned=False
-        )
+        # Open loans from every branch, as listed on the profile
+        current_borrows = [
+            t for loans in fan_out(lambda alias: list(Transaction.objects.using(alias).filter(
+                member=member,
+                transaction_type='borrow',
+                is_returned=False
+            )))
+            for t in loans
+        ]
         
         returned_count = 0
         for transaction in current_borrows:
@@ -312,10 +363,11 @@ def bulk_return_books(request):
             book.save()
             
             # Create return record
-            Transaction.objects.create(
+            Transaction.objects.using(transaction._state.db).create(
                 book=transaction.book,
                 member=transaction.member,
-                transaction_type='return'
+                transaction_type='return',
+                due_date=transaction.due_date
             )
             
             returned_count += 1
@@ -338,17 +390,32 @@ def admin_dashboard(request):
         messages.error(request, 'You are not authorized to access this page.')
         return redirect('home')
     
-    # Get statistics for dashboard
-    total_books = Book.objects.count()
+    # Get statistics for dashboard, summed over every branch database
+    def branch_stats(alias):
+        loans = Transaction.objects.using(alias).filter(transaction_type='borrow', is_returned=False)
+        return {
+            'total_books': Book.objects.using(alias).count(),
+            'borrowed_books': loans.count(),
+            'overdue_books': loans.filter(due_date__lt=date.today()).count(),
+            'recent_transactions': list(
+                Transaction.objects.using(alias).select_related('book').order_by('-transaction_date')[:10]
+            ),
+        }
+    
+    stats = fan_out(branch_stats)
+    total_books = sum(s['total_books'] for s in stats)
     total_members = Member.objects.count()
-    borrowed_books = Transaction.objects.filter(transaction_type='borrow', is_returned=False).count()
-    overdue_books = Transaction.objects.filter(
-        transaction_type='borrow', 
-        is_returned=False,
-        due_date__lt=date.today()
-    ).count()
+    borrowed_books = sum(s['borrowed_books'] for s in stats)
+    overdue_books = sum(s['overdue_books'] for s in stats)
     
-    recent_transactions = Transaction.objects.all().order_by('-transaction_date')[:10]
+    recent_transactions = sorted(
+        (t for s in stats for t in s['recent_transactions']),
+        key=lambda t: t.transaction_date,
+        reverse=True
+    )[:10]
+    
+    # Charts read only the pre-aggregated rollups (see rollup_circulation command)
+    circulation = circulation_summary(days=30)
     
     context = {
         'total_books': total_books,
@@ -356,6 +423,66 @@ def admin_dashboard(request):
         'borrowed_books': borrowed_books,
         'overdue_books': overdue_books,
         'recent_transactions': recent_transactions,
+        'circulation': circulation,
     }
     
-    return render(request, 'admin_dashboard.html', context)
\ No newline at end of file
+    return render(request, 'admin_dashboard.html', context)
+
+
+# Change feed for offline circulation desks: ?since=<cursor>&limit=<n>&model=book|transaction
+
+@require_GET
+def change_feed(request):
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({'error': 'Staff login required.'}, status=403)
+    
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = min(int(request.GET.get('limit', 500)), 1000)
+    except ValueError:
+        return JsonResponse({'error': 'since and limit must be integers.'}, status=400)
+    
+    model = request.GET.get('model')
+    if model not in (None, 'book', 'transaction'):
+        return JsonResponse({'error': 'model must be book or transaction.'}, status=400)
+    
+    changes, cursor, has_more = changes_since(since, limit=max(limit, 1), model=model, branch=request.branch)
+    return JsonResponse({
+        'cursor': cursor,
+        'has_more': has_more,
+        'changes': changes,
+    })
+
+
+
+# Server-sent events: /books/availability/?ids=1,2,3 streams availability changes.
+# Needs an ASGI server running library_project.asgi:application (e.g. uvicorn or
+# daphne). Under WSGI (runserver, wsgi.py) StreamingHttpResponse reads an async
+# iterator to the end before sending anything and this stream never ends, so the
+# request is refused and book pages don't open it.
+
+MAX_WATCHED_BOOKS = 100
+
+async def availability_stream(request):
+    if not isinstance(request, ASGIRequest):
+        # 204 tells EventSource to stop reconnecting
+        return HttpResponse(status=204)
+    
+    try:
+        book_ids = sorted({int(i) for i in request.GET.get('ids', '').split(',') if i.strip()})
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma separated list of book ids.'}, status=400)
+    
+    if not book_ids or len(book_ids) > MAX_WATCHED_BOOKS:
+        return JsonResponse({'error': f'Watch between 1 and {MAX_WATCHED_BOOKS} books.'}, status=400)
+    
+    # Resolved now: the branch context does not outlive the middleware
+    alias = request.branch.database if request.branch else DEFAULT_DB_ALIAS
+    
+    response = StreamingHttpResponse(
+        availability_events(alias, book_ids),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_project.settings')
+    # The test suite needs a second branch database (see test_settings)
+    default_settings = 'library_project.test_settings' if sys.argv[1:2] == ['test'] else 'library_project.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: